@@ -0,0 +1,35 @@
+import argparse
+from datetime import datetime
+
+from web_expense_app import init_db, restore_snapshot, restore_csv_backup, list_snapshots, CSV_BACKUP_DIR
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Restore web_expenses.db from a snapshot or CSV backup')
+    parser.add_argument('--snapshot', help='Snapshot file to restore')
+    parser.add_argument('--at', help='Restore the newest snapshot taken at or before this time (YYYY-MM-DD HH:MM:SS)')
+    parser.add_argument('--csv', action='store_true', help=f'Restore from gzip CSV files in {CSV_BACKUP_DIR}/')
+    parser.add_argument('--list', action='store_true', help='List available snapshots')
+    args = parser.parse_args()
+
+    if args.list:
+        for stamp, path in list_snapshots():
+            print(f"{stamp:%Y-%m-%d %H:%M:%S}  {path}")
+        return
+
+    if args.csv:
+        init_db()
+        restored = restore_csv_backup()
+        for table, count in restored.items():
+            print(f"{table}: {count} rows restored")
+        return
+
+    restore_at = datetime.fromisoformat(args.at) if args.at else None
+    snapshot_path = restore_snapshot(snapshot_path=args.snapshot, at=restore_at)
+    # The snapshot may predate newer tables or columns; bring the schema up to date
+    init_db()
+    print(f"Restored from {snapshot_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,15 @@
 from flask import Flask, render_template, request, jsonify, redirect, url_for, send_file
 import sqlite3
-from datetime import datetime
+from datetime import datetime, date, timedelta
 import os
+import calendar
+import csv
+import gzip
+import glob
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
 import pandas as pd
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
@@ -12,6 +20,25 @@ import io
 
 app = Flask(__name__)
 
+# Backup settings
+BACKUP_DIR = 'backups'
+CSV_BACKUP_DIR = 'recovered_data'
+BACKUP_INTERVAL_HOURS = 24
+BACKUP_RETENTION = 14
+BACKUP_PAGES_PER_STEP = 256
+CSV_RESTORE_BATCH_SIZE = 10000
+# NULL is written as \N; backslashes in real text are doubled so a literal
+# "\N" value survives the round trip
+CSV_NULL = '\\N'
+SNAPSHOT_TIMESTAMP_FORMAT = '%Y%m%d_%H%M%S_%f'
+BACKUP_TABLES = ['categories', 'subcategories', 'budget', 'expenses', 'lends_borrows', 'scheduler_settings', 'recurring_expenses']
+
+# Recurring expense settings
+RRULE_FREQUENCIES = ['DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY']
+RRULE_WEEKDAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+RRULE_KEYS = ['FREQ', 'INTERVAL', 'BYMONTHDAY', 'BYDAY']
+RECURRING_MAX_MONTHS_AHEAD = 12
+
 def init_db():
     conn = sqlite3.connect('web_expenses.db')
     
@@ -78,6 +105,11 @@ def init_db():
             )
         ''')
     
+    # Link generated expenses back to their recurring rule
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(expenses)").fetchall()]
+    if 'recurring_id' not in columns:
+        conn.execute("ALTER TABLE expenses ADD COLUMN recurring_id INTEGER")
+    
     conn.execute('''
         CREATE TABLE IF NOT EXISTS budget (
             id INTEGER PRIMARY KEY,
@@ -119,6 +151,24 @@ def init_db():
         )
     ''')
     
+    # materialized_through is the high-water mark: occurrences up to and
+    # including this date have already been inserted into expenses
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recurring_expenses (
+            id INTEGER PRIMARY KEY,
+            category TEXT,
+            subcategory TEXT,
+            description TEXT,
+            amount REAL,
+            payment_status TEXT DEFAULT 'Pending',
+            rrule TEXT,
+            start_date TEXT,
+            end_date TEXT,
+            materialized_through TEXT,
+            active INTEGER DEFAULT 1
+        )
+    ''')
+    
     # Insert default categories and subcategories
     cursor = conn.execute("SELECT COUNT(*) FROM categories")
     if cursor.fetchone()[0] == 0:
@@ -141,126 +191,240 @@ def init_db():
     conn.commit()
     conn.close()
 
-@app.route('/')
-def index():
-    from datetime import datetime, timedelta
-    current_date = datetime.now()
-    
-    conn = sqlite3.connect('web_expenses.db')
-    
-    # Get budget
-    cursor = conn.execute("SELECT total_budget FROM budget LIMIT 1")
-    budget_row = cursor.fetchone()
-    budget = budget_row[0] if budget_row else 0
-    
-    # Get categories
-    cursor = conn.execute("SELECT name FROM categories ORDER BY name")
-    categories = [row[0] for row in cursor]
-    
-    # Get current month or requested month
-    selected_month = request.args.get('month', current_date.strftime('%Y-%m'))
-    
-    # Get expenses for the selected month grouped by date
+# ---------------------------------------------------------------------------
+# Dashboard view models and fragment cache
+# ---------------------------------------------------------------------------
+
+class ExpenseRow(NamedTuple):
+    id: int
+    date: str
+    category: str
+    subcategory: str
+    description: str
+    amount: float
+    payment_status: str
+    is_savings: int
+
+class LendBorrowRow(NamedTuple):
+    id: int
+    date: str
+    name: str
+    amount: float
+    type: str
+    description: str
+    status: str
+
+class ExpenseListView(NamedTuple):
+    expenses: dict
+    sorted_dates: list
+    available_months: list
+
+class AnalyticsView(NamedTuple):
+    budget: float
+    spent: float
+    pending: float
+    savings: float
+    remaining: float
+    category_data: list
+    subcategory_data: list
+    prev_budget: float
+    prev_spent: float
+    prev_savings: float
+    prev_remaining: float
+    total_savings_all: float
+
+class LendsBorrowsView(NamedTuple):
+    lends_borrows: list
+    total_lends: float
+    total_borrows: float
+
+# Each cached fragment is keyed on (section, month, data version). Mutations
+# bump the version of the data they touch, which makes older entries for
+# that data unreachable; the LRU bound drops them eventually.
+FRAGMENT_CACHE_SIZE = 64
+_data_versions = {'expenses': 0, 'budget': 0, 'lends_borrows': 0}
+_fragment_cache = OrderedDict()
+_fragment_lock = threading.Lock()
+
+# Data each dashboard section is built from
+FRAGMENT_DEPENDENCIES = {
+    'expense_list': ('expenses',),
+    'analytics': ('expenses', 'budget'),
+    'lends_borrows': ('lends_borrows',),
+}
+
+def bump_data_version(*names):
+    with _fragment_lock:
+        for name in names or _data_versions:
+            _data_versions[name] += 1
+
+def build_expense_list_view(conn, month):
     cursor = conn.execute("""
         SELECT id, date, category, subcategory, description, amount, payment_status, is_savings 
         FROM expenses 
         WHERE date LIKE ? 
         ORDER BY date DESC, id DESC
-    """, (f"{selected_month}%",))
-    all_expenses = cursor.fetchall()
+    """, (f"{month}%",))
     
-    # Group expenses by date
+    # Rows arrive sorted by date, so grouping is a single pass and the dict
+    # keys are already in descending date order
     expenses_by_date = {}
-    for expense in all_expenses:
-        expense_date = expense[1]  # date is at index 1
-        if expense_date not in expenses_by_date:
-            expenses_by_date[expense_date] = []
-        expenses_by_date[expense_date].append(expense)
+    for expense in map(ExpenseRow._make, cursor):
+        expenses_by_date.setdefault(expense.date, []).append(expense)
     
-    # Sort dates in descending order
-    sorted_dates = sorted(expenses_by_date.keys(), reverse=True)
-    expenses = expenses_by_date
-    
-    # Get available months for navigation
     cursor = conn.execute("""
         SELECT DISTINCT strftime('%Y-%m', date) as month 
         FROM expenses 
         ORDER BY month DESC
     """)
-    available_months = [row[0] for row in cursor.fetchall()]
-    
-    # Format selected month for display
-    try:
-        selected_month_obj = datetime.strptime(selected_month, '%Y-%m')
-        selected_month_display = selected_month_obj.strftime('%B %Y')
-    except:
-        selected_month_display = current_month
+    available_months = [row[0] for row in cursor]
     
-    # Calculate totals for selected month (only paid expenses, excluding savings)
-    cursor = conn.execute("SELECT SUM(amount) FROM expenses WHERE payment_status = 'Paid' AND is_savings = 0 AND date LIKE ?", (f"{selected_month}%",))
-    spent_row = cursor.fetchone()
-    spent = spent_row[0] if spent_row[0] else 0
-    
-    # Get pending amount for selected month (excluding savings)
-    cursor = conn.execute("SELECT SUM(amount) FROM expenses WHERE payment_status = 'Pending' AND is_savings = 0 AND date LIKE ?", (f"{selected_month}%",))
-    pending_row = cursor.fetchone()
-    pending = pending_row[0] if pending_row[0] else 0
+    return ExpenseListView(expenses_by_date, list(expenses_by_date), available_months)
+
+def _month_totals(conn, month):
+    # Paid, pending (both excluding savings) and savings totals in one scan
+    cursor = conn.execute("""
+        SELECT SUM(CASE WHEN payment_status = 'Paid' AND is_savings = 0 THEN amount END),
+               SUM(CASE WHEN payment_status = 'Pending' AND is_savings = 0 THEN amount END),
+               SUM(CASE WHEN is_savings = 1 THEN amount END)
+        FROM expenses 
+        WHERE date LIKE ?
+    """, (f"{month}%",))
+    return [value or 0 for value in cursor.fetchone()]
+
+def build_analytics_view(conn, month, prev_month):
+    cursor = conn.execute("SELECT total_budget FROM budget LIMIT 1")
+    budget_row = cursor.fetchone()
+    budget = budget_row[0] if budget_row else 0
     
-    # Get savings amount for selected month
-    cursor = conn.execute("SELECT SUM(amount) FROM expenses WHERE is_savings = 1 AND date LIKE ?", (f"{selected_month}%",))
-    savings_row = cursor.fetchone()
-    savings = savings_row[0] if savings_row[0] else 0
+    spent, pending, savings = _month_totals(conn, month)
     
-    # Get analytics data for selected month (excluding savings)
-    cursor = conn.execute("SELECT category, SUM(amount) FROM expenses WHERE payment_status = 'Paid' AND is_savings = 0 AND date LIKE ? GROUP BY category", (f"{selected_month}%",))
+    cursor = conn.execute("SELECT category, SUM(amount) FROM expenses WHERE payment_status = 'Paid' AND is_savings = 0 AND date LIKE ? GROUP BY category", (f"{month}%",))
     category_data = cursor.fetchall()
     
-    cursor = conn.execute("SELECT subcategory, SUM(amount) FROM expenses WHERE payment_status = 'Paid' AND is_savings = 0 AND subcategory IS NOT NULL AND subcategory != '' AND date LIKE ? GROUP BY subcategory", (f"{selected_month}%",))
+    cursor = conn.execute("SELECT subcategory, SUM(amount) FROM expenses WHERE payment_status = 'Paid' AND is_savings = 0 AND subcategory IS NOT NULL AND subcategory != '' AND date LIKE ? GROUP BY subcategory", (f"{month}%",))
     subcategory_data = cursor.fetchall()
     
-    # Get previous month data
-    current_month = current_date.strftime("%B %Y")
-    
-    # Calculate previous month
-    if current_date.month == 1:
-        prev_month_date = current_date.replace(year=current_date.year-1, month=12)
-    else:
-        prev_month_date = current_date.replace(month=current_date.month-1)
-    
-    previous_month = prev_month_date.strftime("%B %Y")
-    prev_month_str = prev_month_date.strftime("%Y-%m")
-    
-    # Get previous month expenses
-    cursor = conn.execute("SELECT SUM(amount) FROM expenses WHERE payment_status = 'Paid' AND is_savings = 0 AND date LIKE ?", (f"{prev_month_str}%",))
-    prev_spent_row = cursor.fetchone()
-    prev_spent = prev_spent_row[0] if prev_spent_row[0] else 0
+    prev_spent, _, prev_savings = _month_totals(conn, prev_month)
     
-    cursor = conn.execute("SELECT SUM(amount) FROM expenses WHERE is_savings = 1 AND date LIKE ?", (f"{prev_month_str}%",))
-    prev_savings_row = cursor.fetchone()
-    prev_savings = prev_savings_row[0] if prev_savings_row[0] else 0
-    
-    # Get total savings across all months
     cursor = conn.execute("SELECT SUM(amount) FROM expenses WHERE is_savings = 1")
-    total_savings_all_row = cursor.fetchone()
-    total_savings_all = total_savings_all_row[0] if total_savings_all_row[0] else 0
+    total_savings_all = cursor.fetchone()[0] or 0
+    
+    # Assume same budget for previous month (you can modify this logic)
+    prev_budget = budget
     
-    # Get lends and borrows data for selected month
+    return AnalyticsView(budget, spent, pending, savings, budget - spent,
+                         category_data, subcategory_data,
+                         prev_budget, prev_spent, prev_savings, prev_budget - prev_spent,
+                         total_savings_all)
+
+def build_lends_borrows_view(conn, month):
     cursor = conn.execute("""
         SELECT id, date, name, amount, type, description, status 
         FROM lends_borrows 
         WHERE date LIKE ? 
         ORDER BY date DESC, id DESC
-    """, (f"{selected_month}%",))
-    lends_borrows = cursor.fetchall()
+    """, (f"{month}%",))
+    lends_borrows = [LendBorrowRow._make(row) for row in cursor]
+    
+    # Totals cover ALL months (not just selected month)
+    cursor = conn.execute("""
+        SELECT SUM(CASE WHEN type = 'Lend' THEN amount END),
+               SUM(CASE WHEN type = 'Borrow' THEN amount END)
+        FROM lends_borrows
+    """)
+    total_lends, total_borrows = [value or 0 for value in cursor.fetchone()]
+    
+    return LendsBorrowsView(lends_borrows, total_lends, total_borrows)
+
+def _previous_month(month):
+    month_obj = datetime.strptime(month, '%Y-%m')
+    if month_obj.month == 1:
+        return month_obj.replace(year=month_obj.year-1, month=12)
+    return month_obj.replace(month=month_obj.month-1)
+
+FRAGMENT_BUILDERS = {
+    'expense_list': lambda conn, month, current_month: build_expense_list_view(conn, month),
+    'analytics': lambda conn, month, current_month: build_analytics_view(conn, month, _previous_month(current_month).strftime('%Y-%m')),
+    'lends_borrows': lambda conn, month, current_month: build_lends_borrows_view(conn, month),
+}
+
+def get_fragment(conn, section, month, current_month):
+    # The previous-month comparison follows the calendar, so only analytics
+    # are also keyed on the current month
+    with _fragment_lock:
+        versions = tuple(_data_versions[name] for name in FRAGMENT_DEPENDENCIES[section])
+        if section == 'analytics':
+            key = (section, month, versions, current_month)
+        else:
+            key = (section, month, versions)
+        if key in _fragment_cache:
+            _fragment_cache.move_to_end(key)
+            return _fragment_cache[key]
+    
+    view = FRAGMENT_BUILDERS[section](conn, month, current_month)
+    
+    with _fragment_lock:
+        # Only cache if nothing was written while the view was being built
+        if versions == tuple(_data_versions[name] for name in FRAGMENT_DEPENDENCIES[section]):
+            _fragment_cache[key] = view
+            while len(_fragment_cache) > FRAGMENT_CACHE_SIZE:
+                _fragment_cache.popitem(last=False)
+    return view
+
+def wants_fragment():
+    return request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+def _to_json(value):
+    # Convert view models to plain JSON, keeping row field names instead of
+    # positional arrays
+    if hasattr(value, '_asdict'):
+        return {key: _to_json(item) for key, item in value._asdict().items()}
+    if isinstance(value, dict):
+        return {key: _to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    return value
+
+def fragment_response(sections, month):
+    # Partial update for a status toggle: only the affected dashboard
+    # sections are rebuilt (or served from cache) and returned
+    current_month = datetime.now().strftime('%Y-%m')
+    conn = sqlite3.connect('web_expenses.db')
+    fragments = {}
+    for section in sections:
+        view = get_fragment(conn, section, month, current_month)
+        fragments[section] = _to_json(view)
+    conn.close()
+    return jsonify({'success': True, 'month': month, 'fragments': fragments})
+
+@app.route('/')
+def index():
+    current_date = datetime.now()
+    current_month = current_date.strftime("%B %Y")
+    
+    # Get current month or requested month
+    selected_month = request.args.get('month', current_date.strftime('%Y-%m'))
+    
+    # Generate any recurring expenses due in the selected month
+    materialize_for_month(selected_month)
+    
+    # Format selected month for display
+    try:
+        selected_month_obj = datetime.strptime(selected_month, '%Y-%m')
+        selected_month_display = selected_month_obj.strftime('%B %Y')
+    except ValueError:
+        selected_month_display = current_month
     
-    # Calculate total lends and borrows for ALL months (not just selected month)
-    cursor = conn.execute("SELECT SUM(amount) FROM lends_borrows WHERE type = 'Lend'")
-    total_lends_row = cursor.fetchone()
-    total_lends = total_lends_row[0] if total_lends_row[0] else 0
+    conn = sqlite3.connect('web_expenses.db')
     
-    cursor = conn.execute("SELECT SUM(amount) FROM lends_borrows WHERE type = 'Borrow'")
-    total_borrows_row = cursor.fetchone()
-    total_borrows = total_borrows_row[0] if total_borrows_row[0] else 0
+    # Get categories
+    cursor = conn.execute("SELECT name FROM categories ORDER BY name")
+    categories = [row[0] for row in cursor]
+    
+    expense_list = get_fragment(conn, 'expense_list', selected_month, current_date.strftime('%Y-%m'))
+    analytics = get_fragment(conn, 'analytics', selected_month, current_date.strftime('%Y-%m'))
+    lends_borrows = get_fragment(conn, 'lends_borrows', selected_month, current_date.strftime('%Y-%m'))
     
     # Get scheduler settings
     cursor = conn.execute("SELECT email_hour, email_minute FROM scheduler_settings LIMIT 1")
@@ -270,39 +434,20 @@ def index():
     else:
         email_hour, email_minute = 9, 0
     
-    # Assume same budget for previous month (you can modify this logic)
-    prev_budget = budget
-    prev_remaining = prev_budget - prev_spent
-    
     conn.close()
     
     return render_template('index.html', 
-                         budget=budget, 
-                         spent=spent,
-                         pending=pending,
-                         savings=savings,
-                         remaining=budget-spent,
                          categories=categories, 
-                         expenses=expenses,
-                         sorted_dates=sorted_dates,
                          selected_month=selected_month,
                          selected_month_display=selected_month_display,
-                         available_months=available_months,
-                         category_data=category_data,
-                         subcategory_data=subcategory_data,
                          current_month=current_month,
-                         previous_month=previous_month,
-                         prev_budget=prev_budget,
-                         prev_spent=prev_spent,
-                         prev_savings=prev_savings,
-                         prev_remaining=prev_remaining,
+                         previous_month=_previous_month(current_date.strftime('%Y-%m')).strftime("%B %Y"),
                          current_date=current_date.strftime('%Y-%m-%d'),
-                         total_savings_all=total_savings_all,
-                         total_lends=total_lends,
-                         total_borrows=total_borrows,
-                         lends_borrows=lends_borrows,
                          email_hour=email_hour,
-                         email_minute=email_minute)
+                         email_minute=email_minute,
+                         **expense_list._asdict(),
+                         **analytics._asdict(),
+                         **lends_borrows._asdict())
 
 @app.route('/get_category_data')
 def get_category_data():
@@ -392,6 +537,7 @@ def set_budget():
     conn.execute("INSERT INTO budget (total_budget) VALUES (?)", (budget,))
     conn.commit()
     conn.close()
+    bump_data_version('budget')
     return redirect(url_for('index'))
 
 @app.route('/add_expense', methods=['POST'])
@@ -441,6 +587,7 @@ def add_expense():
                 (date, category, subcategory, description, amount, payment_status, is_savings))
     conn.commit()
     conn.close()
+    bump_data_version('expenses')
     return redirect(url_for('index'))
 
 @app.route('/get_subcategories/<category>')
@@ -462,8 +609,15 @@ def update_payment_status():
     status = request.form['status']
     conn = sqlite3.connect('web_expenses.db')
     conn.execute("UPDATE expenses SET payment_status = ? WHERE id = ?", (status, expense_id))
+    cursor = conn.execute("SELECT date FROM expenses WHERE id = ?", (expense_id,))
+    expense_row = cursor.fetchone()
     conn.commit()
     conn.close()
+    bump_data_version('expenses')
+    
+    # A status toggle only changes the expense list and the totals
+    if wants_fragment() and expense_row:
+        return fragment_response(['expense_list', 'analytics'], expense_row[0][:7])
     return redirect(url_for('index'))
 
 @app.route('/edit_expense/<int:expense_id>', methods=['GET', 'POST'])
@@ -484,6 +638,7 @@ def edit_expense(expense_id):
                     (date, category, subcategory, description, amount, payment_status, is_savings, expense_id))
         conn.commit()
         conn.close()
+        bump_data_version('expenses')
         return redirect(url_for('index'))
     
     # Get expense details for editing
@@ -507,6 +662,7 @@ def delete_expense(expense_id):
     conn.execute("DELETE FROM expenses WHERE id = ?", (expense_id,))
     conn.commit()
     conn.close()
+    bump_data_version('expenses')
     return redirect(url_for('index'))
 
 @app.route('/get_monthly_data')
@@ -634,6 +790,7 @@ def add_lend_borrow():
                 (date, name, amount, lb_type, description, status))
     conn.commit()
     conn.close()
+    bump_data_version('lends_borrows')
     return redirect(url_for('index'))
 
 @app.route('/update_lend_borrow_status', methods=['POST'])
@@ -642,8 +799,14 @@ def update_lend_borrow_status():
     status = request.form['status']
     conn = sqlite3.connect('web_expenses.db')
     conn.execute("UPDATE lends_borrows SET status = ? WHERE id = ?", (status, lb_id))
+    cursor = conn.execute("SELECT date FROM lends_borrows WHERE id = ?", (lb_id,))
+    lb_row = cursor.fetchone()
     conn.commit()
     conn.close()
+    bump_data_version('lends_borrows')
+    
+    if wants_fragment() and lb_row:
+        return fragment_response(['lends_borrows'], lb_row[0][:7])
     return redirect(url_for('index'))
 
 @app.route('/edit_lend_borrow/<int:lb_id>', methods=['GET', 'POST'])
@@ -663,6 +826,7 @@ def edit_lend_borrow(lb_id):
                     (date, name, amount, lb_type, description, status, lb_id))
         conn.commit()
         conn.close()
+        bump_data_version('lends_borrows')
         return redirect(url_for('index'))
     
     # Get lend/borrow details for editing
@@ -681,6 +845,7 @@ def delete_lend_borrow(lb_id):
     conn.execute("DELETE FROM lends_borrows WHERE id = ?", (lb_id,))
     conn.commit()
     conn.close()
+    bump_data_version('lends_borrows')
     return redirect(url_for('index'))
 
 @app.route('/send_email_report', methods=['POST'])
@@ -698,6 +863,556 @@ def get_overspending_patterns():
     # Placeholder route - returns empty patterns for now
     return jsonify([])
 
+# ---------------------------------------------------------------------------
+# Recurring expenses
+# ---------------------------------------------------------------------------
+
+def parse_rrule(rule):
+    # Supports the RRULE subset FREQ, INTERVAL, BYMONTHDAY (monthly rules
+    # only, -1 = last day) and BYDAY (weekly rules only),
+    # e.g. "FREQ=MONTHLY;INTERVAL=1;BYMONTHDAY=15"
+    parts = {}
+    for part in (rule or '').upper().split(';'):
+        if not part.strip():
+            continue
+        key, _, value = part.partition('=')
+        key = key.strip()
+        # Anything else (COUNT, UNTIL, ...) would be silently ignored and
+        # generate occurrences forever, so reject it up front
+        if key not in RRULE_KEYS:
+            raise ValueError(f"Unsupported RRULE part: {key}")
+        parts[key] = value.strip()
+
+    freq = parts.get('FREQ')
+    if freq not in RRULE_FREQUENCIES:
+        raise ValueError(f"Unsupported FREQ: {freq}")
+
+    try:
+        interval = int(parts.get('INTERVAL', 1))
+        bymonthday = int(parts['BYMONTHDAY']) if 'BYMONTHDAY' in parts else None
+    except ValueError:
+        raise ValueError('INTERVAL and BYMONTHDAY must be integers')
+    if interval < 1:
+        raise ValueError('INTERVAL must be at least 1')
+    # Other frequencies would ignore it (DAILY, WEEKLY) or read it differently
+    # from RFC 5545 (YEARLY means every month), so only MONTHLY accepts it
+    if bymonthday is not None and freq != 'MONTHLY':
+        raise ValueError('BYMONTHDAY is only supported for MONTHLY rules')
+    if bymonthday is not None and not (1 <= bymonthday <= 31 or bymonthday == -1):
+        raise ValueError('BYMONTHDAY must be between 1 and 31, or -1')
+
+    byday = None
+    if 'BYDAY' in parts:
+        if freq != 'WEEKLY':
+            raise ValueError('BYDAY is only supported for WEEKLY rules')
+        try:
+            byday = sorted({RRULE_WEEKDAYS.index(day.strip()) for day in parts['BYDAY'].split(',')})
+        except ValueError:
+            raise ValueError(f"Invalid BYDAY: {parts['BYDAY']}")
+
+    return {'freq': freq, 'interval': interval, 'bymonthday': bymonthday, 'byday': byday}
+
+def _month_day(year, month, day):
+    last_day = calendar.monthrange(year, month)[1]
+    if day == -1 or day > last_day:
+        day = last_day
+    return date(year, month, day)
+
+def rrule_occurrences(rule, start, after, until):
+    # Yields occurrence dates d with start <= d, after < d <= until. Iteration
+    # jumps straight to the period containing `after`, so the cost depends on
+    # the window size, not on how old the rule is.
+    if isinstance(rule, str):
+        rule = parse_rrule(rule)
+    interval = rule['interval']
+    first = max(start, after + timedelta(days=1))
+    if first > until:
+        return
+
+    if rule['freq'] == 'DAILY':
+        step = (first - start).days
+        current = start + timedelta(days=-(-step // interval) * interval)
+        while current <= until:
+            yield current
+            current += timedelta(days=interval)
+
+    elif rule['freq'] == 'WEEKLY':
+        weekdays = rule['byday'] if rule['byday'] is not None else [start.weekday()]
+        anchor = start - timedelta(days=start.weekday())
+        weeks = (first - anchor).days // 7
+        week_start = anchor + timedelta(weeks=weeks - weeks % interval)
+        while week_start <= until:
+            for weekday in weekdays:
+                current = week_start + timedelta(days=weekday)
+                if first <= current <= until:
+                    yield current
+            week_start += timedelta(weeks=interval)
+
+    else:
+        # MONTHLY and YEARLY both step through months from the start month
+        step = interval if rule['freq'] == 'MONTHLY' else 12 * interval
+        day = rule['bymonthday'] if rule['bymonthday'] is not None else start.day
+        months = (first.year - start.year) * 12 + (first.month - start.month)
+        months -= months % step
+        while True:
+            year, month = divmod(start.month - 1 + months, 12)
+            current = _month_day(start.year + year, month + 1, day)
+            if current > until:
+                break
+            if current >= first:
+                yield current
+            months += step
+
+def materialize_recurring_expenses(through, db_path='web_expenses.db'):
+    # Insert every occurrence due up to `through` that has not been generated
+    # yet. Each rule keeps a high-water mark (materialized_through), so only
+    # the window since the last run is considered and re-running is a no-op.
+    through_str = through.strftime('%Y-%m-%d')
+    due_rules_sql = """
+        FROM recurring_expenses
+        WHERE active = 1 AND start_date <= ?
+          AND (materialized_through IS NULL OR materialized_through < ?)
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        # Most calls (every page view) find nothing to do; check that without
+        # taking the write lock
+        cursor = conn.execute("SELECT 1 " + due_rules_sql + " LIMIT 1", (through_str, through_str))
+        if not cursor.fetchone():
+            return 0
+        
+        # Take the write lock before reading the high-water marks so two
+        # concurrent runs can't both insert the same occurrences
+        conn.execute('BEGIN IMMEDIATE')
+        cursor = conn.execute("""
+            SELECT id, category, subcategory, description, amount, payment_status, rrule,
+                   start_date, end_date, materialized_through
+        """ + due_rules_sql, (through_str, through_str))
+        rules = cursor.fetchall()
+
+        new_expenses = []
+        marks = []
+        for rule_id, category, subcategory, description, amount, payment_status, rrule, start_date, end_date, materialized_through in rules:
+            start = datetime.strptime(start_date, '%Y-%m-%d').date()
+            if materialized_through:
+                after = datetime.strptime(materialized_through, '%Y-%m-%d').date()
+            else:
+                after = start - timedelta(days=1)
+            until = through
+            if end_date:
+                until = min(until, datetime.strptime(end_date, '%Y-%m-%d').date())
+
+            # Rules saved before validation was tightened may no longer parse;
+            # skip them rather than failing every page view
+            try:
+                parsed_rule = parse_rrule(rrule)
+            except ValueError as e:
+                app.logger.error(f"Skipping recurring expense {rule_id}: {e}")
+                continue
+
+            is_savings = 1 if category.lower() == 'savings' else 0
+            for occurrence in rrule_occurrences(parsed_rule, start, after, until):
+                new_expenses.append((occurrence.strftime('%Y-%m-%d'), category, subcategory, description,
+                                     amount, payment_status, is_savings, rule_id))
+            marks.append((through_str, rule_id))
+
+        if new_expenses:
+            conn.executemany("INSERT INTO expenses (date, category, subcategory, description, amount, payment_status, is_savings, recurring_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             new_expenses)
+        if marks:
+            conn.executemany("UPDATE recurring_expenses SET materialized_through = ? WHERE id = ?", marks)
+        conn.commit()
+    finally:
+        conn.close()
+    if new_expenses:
+        bump_data_version('expenses')
+    return len(new_expenses)
+
+def materialize_for_month(month):
+    # Generate recurring expenses up to the end of a viewed month ('YYYY-MM'),
+    # but never further ahead than RECURRING_MAX_MONTHS_AHEAD
+    try:
+        month_obj = datetime.strptime(month, '%Y-%m')
+    except ValueError:
+        return 0
+    today = date.today()
+    if (month_obj.year - today.year) * 12 + (month_obj.month - today.month) > RECURRING_MAX_MONTHS_AHEAD:
+        return 0
+    return materialize_recurring_expenses(_month_day(month_obj.year, month_obj.month, -1))
+
+@app.route('/add_recurring_expense', methods=['POST'])
+def add_recurring_expense():
+    category = request.form['category']
+    subcategory = request.form.get('subcategory', '')
+    description = request.form['description']
+    amount = float(request.form['amount'])
+    payment_status = request.form.get('payment_status', 'Pending')
+    frequency = request.form.get('frequency', 'Monthly')
+    start_date = request.form.get('start_date', datetime.now().strftime('%Y-%m-%d'))
+    end_date = request.form.get('end_date', '').strip() or None
+
+    # Monthly and weekly presets are stored as RRULE strings, like custom rules
+    if frequency == 'Monthly':
+        day_of_month = request.form.get('day_of_month', '').strip()
+        rrule = f"FREQ=MONTHLY;BYMONTHDAY={day_of_month}" if day_of_month else 'FREQ=MONTHLY'
+    elif frequency == 'Weekly':
+        rrule = 'FREQ=WEEKLY'
+    else:
+        rrule = request.form.get('rrule', '')
+
+    try:
+        parse_rrule(rrule)
+        datetime.strptime(start_date, '%Y-%m-%d')
+        if end_date:
+            datetime.strptime(end_date, '%Y-%m-%d')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    conn = sqlite3.connect('web_expenses.db')
+    conn.execute("INSERT INTO recurring_expenses (category, subcategory, description, amount, payment_status, rrule, start_date, end_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (category, subcategory, description, amount, payment_status, rrule.upper(), start_date, end_date))
+    conn.commit()
+    conn.close()
+
+    materialize_recurring_expenses(date.today())
+    return redirect(url_for('index'))
+
+@app.route('/get_recurring_expenses')
+def get_recurring_expenses():
+    conn = sqlite3.connect('web_expenses.db')
+    cursor = conn.execute("""
+        SELECT id, category, subcategory, description, amount, payment_status, rrule, start_date, end_date, materialized_through, active
+        FROM recurring_expenses
+        ORDER BY category, description
+    """)
+    rules = cursor.fetchall()
+    conn.close()
+
+    return jsonify([{
+        'id': rule[0],
+        'category': rule[1],
+        'subcategory': rule[2] or '',
+        'description': rule[3],
+        'amount': rule[4],
+        'payment_status': rule[5],
+        'rrule': rule[6],
+        'start_date': rule[7],
+        'end_date': rule[8],
+        'materialized_through': rule[9],
+        'active': rule[10]
+    } for rule in rules])
+
+@app.route('/update_recurring_expense_status', methods=['POST'])
+def update_recurring_expense_status():
+    rule_id = request.form['rule_id']
+    active = 1 if request.form.get('active', '1') in ('1', 'true', 'True') else 0
+    conn = sqlite3.connect('web_expenses.db')
+    if active:
+        # Skip the paused period: move the high-water mark up to yesterday so
+        # reactivation doesn't backfill the occurrences missed while paused.
+        # The mark never moves backwards.
+        yesterday = (date.today() - timedelta(days=1)).strftime('%Y-%m-%d')
+        conn.execute("""
+            UPDATE recurring_expenses
+            SET active = 1,
+                materialized_through = CASE
+                    WHEN materialized_through IS NULL OR materialized_through < ? THEN ?
+                    ELSE materialized_through
+                END
+            WHERE id = ? AND active = 0
+        """, (yesterday, yesterday, rule_id))
+    else:
+        # Like deleting a rule: pending occurrences after today only exist
+        # because a future month was viewed, so they go, and the high-water
+        # mark is pulled back so they aren't considered generated
+        today = date.today().strftime('%Y-%m-%d')
+        conn.execute("DELETE FROM expenses WHERE recurring_id = ? AND date > ? AND payment_status = 'Pending'",
+                    (rule_id, today))
+        conn.execute("""
+            UPDATE recurring_expenses
+            SET active = 0,
+                materialized_through = CASE
+                    WHEN materialized_through > ? THEN ?
+                    ELSE materialized_through
+                END
+            WHERE id = ?
+        """, (today, today, rule_id))
+    conn.commit()
+    conn.close()
+    bump_data_version('expenses')
+    return redirect(url_for('index'))
+
+@app.route('/delete_recurring_expense/<int:rule_id>', methods=['POST'])
+def delete_recurring_expense(rule_id):
+    # Past and paid occurrences are kept; pending ones dated after today only
+    # exist because a future month was viewed, so they go with the rule
+    conn = sqlite3.connect('web_expenses.db')
+    conn.execute("DELETE FROM expenses WHERE recurring_id = ? AND date > ? AND payment_status = 'Pending'",
+                (rule_id, date.today().strftime('%Y-%m-%d')))
+    conn.execute("DELETE FROM recurring_expenses WHERE id = ?", (rule_id,))
+    conn.commit()
+    conn.close()
+    bump_data_version('expenses')
+    return redirect(url_for('index'))
+
+# ---------------------------------------------------------------------------
+# Backup and restore
+# ---------------------------------------------------------------------------
+
+_snapshot_lock = threading.Lock()
+
+def create_snapshot(db_path='web_expenses.db', backup_dir=BACKUP_DIR):
+    # Online backup in small page steps, so writers are only blocked for one
+    # step at a time instead of the whole copy
+    os.makedirs(backup_dir, exist_ok=True)
+
+    # Manual and scheduled backups can coincide; the lock serialises them
+    # within the app and the microsecond timestamp keeps names unique
+    with _snapshot_lock:
+        timestamp = datetime.now().strftime(SNAPSHOT_TIMESTAMP_FORMAT)
+        snapshot_path = os.path.join(backup_dir, f"web_expenses_{timestamp}.db")
+        partial_path = snapshot_path + '.part'
+
+        src = sqlite3.connect(db_path)
+        dst = sqlite3.connect(partial_path)
+        try:
+            src.backup(dst, pages=BACKUP_PAGES_PER_STEP, sleep=0.005)
+        finally:
+            dst.close()
+            src.close()
+
+        # Only expose complete snapshots under their final name
+        os.replace(partial_path, snapshot_path)
+    return snapshot_path
+
+def list_snapshots(backup_dir=BACKUP_DIR):
+    # (timestamp, path) pairs, newest first
+    snapshots = []
+    for path in glob.glob(os.path.join(backup_dir, 'web_expenses_*.db')):
+        stamp = os.path.basename(path)[len('web_expenses_'):-len('.db')]
+        # Older snapshots were named with one-second resolution
+        for fmt in (SNAPSHOT_TIMESTAMP_FORMAT, '%Y%m%d_%H%M%S'):
+            try:
+                snapshots.append((datetime.strptime(stamp, fmt), path))
+                break
+            except ValueError:
+                continue
+    snapshots.sort(reverse=True)
+    return snapshots
+
+def prune_snapshots(backup_dir=BACKUP_DIR, keep=BACKUP_RETENTION):
+    # Keep only the newest `keep` snapshots
+    removed = []
+    for _, path in list_snapshots(backup_dir)[keep:]:
+        os.remove(path)
+        removed.append(path)
+    return removed
+
+def restore_snapshot(snapshot_path=None, at=None, db_path='web_expenses.db', backup_dir=BACKUP_DIR):
+    # Restore a specific snapshot file, or the newest one taken at or before
+    # `at` (point-in-time), or simply the latest one
+    if snapshot_path is None:
+        candidates = list_snapshots(backup_dir)
+        if at is not None:
+            candidates = [(stamp, path) for stamp, path in candidates if stamp <= at]
+        if not candidates:
+            raise FileNotFoundError('No snapshot available to restore')
+        snapshot_path = candidates[0][1]
+    elif not os.path.exists(snapshot_path):
+        raise FileNotFoundError(snapshot_path)
+
+    # Copy pages straight from the snapshot into the live file; this replaces
+    # the whole database in one pass instead of re-inserting rows
+    src = sqlite3.connect(snapshot_path)
+    dst = sqlite3.connect(db_path)
+    try:
+        src.backup(dst, pages=BACKUP_PAGES_PER_STEP, sleep=0.005)
+    finally:
+        dst.close()
+        src.close()
+    return snapshot_path
+
+def _encode_csv_value(value):
+    if value is None:
+        return CSV_NULL
+    if isinstance(value, str):
+        return value.replace('\\', '\\\\')
+    return value
+
+def _decode_csv_value(value):
+    if value == CSV_NULL:
+        return None
+    return value.replace('\\\\', '\\')
+
+def export_csv_backup(db_path='web_expenses.db', csv_dir=CSV_BACKUP_DIR):
+    # Stream every table into its own gzip-compressed CSV file
+    os.makedirs(csv_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    written = {}
+    partial_paths = {}
+    try:
+        # One read transaction, so every table is exported as of the same
+        # moment (e.g. expenses and recurring_expenses high-water marks agree)
+        conn.execute('BEGIN')
+        for table in BACKUP_TABLES:
+            cursor = conn.execute(f"SELECT * FROM {table}")
+            header = [column[0] for column in cursor.description]
+            path = os.path.join(csv_dir, f"{table}.csv.gz")
+            partial_paths[path] = path + '.part'
+            count = 0
+            with gzip.open(partial_paths[path], 'wt', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                # Iterating the cursor keeps memory flat regardless of table size
+                for row in cursor:
+                    writer.writerow([_encode_csv_value(value) for value in row])
+                    count += 1
+            written[table] = count
+        conn.rollback()
+
+        # Only replace the previous backup once every table has been written
+        for path, partial_path in partial_paths.items():
+            os.replace(partial_path, path)
+    except BaseException:
+        for partial_path in partial_paths.values():
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        raise
+    finally:
+        conn.close()
+    return written
+
+def restore_csv_backup(db_path='web_expenses.db', csv_dir=CSV_BACKUP_DIR, batch_size=CSV_RESTORE_BATCH_SIZE):
+    # Rows are streamed from disk and inserted in batches so large tables
+    # never sit in memory. The whole restore is one transaction: a malformed
+    # row or truncated file rolls back to the data as it was before.
+    conn = sqlite3.connect(db_path)
+    restored = {}
+    try:
+        for table in BACKUP_TABLES:
+            path = os.path.join(csv_dir, f"{table}.csv.gz")
+            if not os.path.exists(path):
+                continue
+
+            table_columns = {column[1] for column in conn.execute(f"PRAGMA table_info({table})")}
+            with gzip.open(path, 'rt', newline='', encoding='utf-8') as f:
+                reader = csv.reader(f)
+                header = next(reader, None)
+                if not header:
+                    continue
+                unknown = [column for column in header if column not in table_columns]
+                if unknown:
+                    raise ValueError(f"Unknown columns for {table}: {', '.join(unknown)}")
+
+                placeholders = ', '.join('?' for _ in header)
+                insert_sql = f"INSERT INTO {table} ({', '.join(header)}) VALUES ({placeholders})"
+
+                conn.execute(f"DELETE FROM {table}")
+                count = 0
+                batch = []
+                for row in reader:
+                    batch.append([_decode_csv_value(value) for value in row])
+                    if len(batch) >= batch_size:
+                        conn.executemany(insert_sql, batch)
+                        count += len(batch)
+                        batch = []
+                if batch:
+                    conn.executemany(insert_sql, batch)
+                    count += len(batch)
+            restored[table] = count
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return restored
+
+def run_scheduled_backup():
+    snapshot_path = create_snapshot()
+    prune_snapshots()
+    return snapshot_path
+
+def _scheduler_loop():
+    interval = BACKUP_INTERVAL_HOURS * 3600
+    while True:
+        try:
+            materialize_recurring_expenses(date.today())
+        except Exception as e:
+            app.logger.error(f"Recurring expense materialization failed: {e}")
+        
+        snapshots = list_snapshots()
+        last_backup = snapshots[0][0] if snapshots else None
+        if last_backup is None or (datetime.now() - last_backup).total_seconds() >= interval:
+            try:
+                run_scheduled_backup()
+            except Exception as e:
+                app.logger.error(f"Scheduled backup failed: {e}")
+        time.sleep(60)
+
+def start_scheduler():
+    thread = threading.Thread(target=_scheduler_loop, name='scheduler', daemon=True)
+    thread.start()
+    return thread
+
+@app.route('/create_backup', methods=['POST'])
+def create_backup():
+    snapshot_path = run_scheduled_backup()
+    return jsonify({'success': True, 'snapshot': os.path.basename(snapshot_path)})
+
+@app.route('/get_backups')
+def get_backups():
+    return jsonify([
+        {'snapshot': os.path.basename(path), 'created': stamp.strftime('%Y-%m-%d %H:%M:%S')}
+        for stamp, path in list_snapshots()
+    ])
+
+@app.route('/restore_backup', methods=['POST'])
+def restore_backup():
+    snapshot = request.form.get('snapshot', '').strip()
+    at = request.form.get('at', '').strip()
+
+    snapshot_path = None
+    if snapshot:
+        # Only allow snapshots from the backup directory
+        snapshot_path = os.path.join(BACKUP_DIR, os.path.basename(snapshot))
+
+    restore_at = None
+    if at:
+        try:
+            restore_at = datetime.fromisoformat(at)
+        except ValueError:
+            return jsonify({'error': 'Invalid restore time'}), 400
+
+    try:
+        restored_from = restore_snapshot(snapshot_path=snapshot_path, at=restore_at)
+    except FileNotFoundError:
+        return jsonify({'error': 'Snapshot not found'}), 404
+    except sqlite3.DatabaseError as e:
+        return jsonify({'error': f"Snapshot could not be restored: {e}"}), 400
+    # The snapshot may predate newer tables or columns; bring the schema up to date
+    init_db()
+    bump_data_version()
+
+    return jsonify({'success': True, 'snapshot': os.path.basename(restored_from)})
+
+@app.route('/export_csv_backup', methods=['POST'])
+def export_csv_backup_route():
+    written = export_csv_backup()
+    return jsonify({'success': True, 'tables': written})
+
+@app.route('/restore_csv_backup', methods=['POST'])
+def restore_csv_backup_route():
+    try:
+        restored = restore_csv_backup()
+    except (ValueError, sqlite3.Error, csv.Error, EOFError, gzip.BadGzipFile) as e:
+        return jsonify({'error': f"CSV restore failed, no data was changed: {e}"}), 400
+    bump_data_version()
+    return jsonify({'success': True, 'tables': restored})
+
 if __name__ == '__main__':
     init_db()
+    # The debug reloader runs this block twice; only the serving child starts the scheduler
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_scheduler()
     app.run(debug=True, host='127.0.0.1', port=5001)
\ No newline at end of file